@@ -69,7 +69,8 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD', default='postgres_password'),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='5432'),
-        'CONN_MAX_AGE': 600,
+        'CONN_MAX_AGE': None,  # Persistent; health checks drop dead connections
+        'CONN_HEALTH_CHECKS': True,
         'OPTIONS': {
             'connect_timeout': 10,
             'options': f"-c search_path={config('DB_SCHEMA', default='shipment')}",
@@ -77,6 +78,27 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by every gunicorn worker and the consumer, so invalidating a key on
+# write reaches all of them. Without REDIS_URL (local runs, tests) each
+# process gets its own locmem cache and only the TTLs bound staleness.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'shipping-service',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shipping-service',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -135,6 +157,7 @@ RABBITMQ_USER = config('RABBITMQ_USER', default='guest')
 RABBITMQ_PASSWORD = config('RABBITMQ_PASSWORD', default='guest')
 RABBITMQ_VHOST = config('RABBITMQ_VHOST', default='/')
 RABBITMQ_EXCHANGE = config('RABBITMQ_EXCHANGE', default='ecommerce_events')
+RABBITMQ_PREFETCH_COUNT = config('RABBITMQ_PREFETCH_COUNT', default=100, cast=int)
 
 # Logging configuration
 LOGGING = {
@@ -190,3 +213,6 @@ SWAGGER_SETTINGS = {
     'JSON_EDITOR': True,
     'SUPPORTED_SUBMIT_METHODS': ['get', 'post', 'put', 'delete', 'patch'],
 }
+
+# Generated schema is cached outside development so it is built once
+SWAGGER_CACHE_TIMEOUT = config('SWAGGER_CACHE_TIMEOUT', default=0 if DEBUG else 3600, cast=int)
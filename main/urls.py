@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
@@ -40,6 +41,10 @@ schema_view = get_schema_view(
     public=True,
     permission_classes=[permissions.AllowAny],
 )
+schema_cache = {'cache_timeout': settings.SWAGGER_CACHE_TIMEOUT}
+if settings.SWAGGER_CACHE_TIMEOUT > 0:
+    # drf_yasg warns about cache_kwargs whenever caching is off
+    schema_cache['cache_kwargs'] = {'key_prefix': 'swagger'}
 
 urlpatterns = [
     # Admin
@@ -49,9 +54,11 @@ urlpatterns = [
     path('v1/', include(router.urls)),
 
     # API Documentation
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-    path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('docs/', include([
+        path('swagger/', schema_view.with_ui('swagger', **schema_cache), name='schema-swagger-ui'),
+        path('redoc/', schema_view.with_ui('redoc', **schema_cache), name='schema-redoc'),
+        path('swagger.json', schema_view.without_ui(**schema_cache), name='schema-json'),
+    ])),
 
     # Health check
     path('health/', include('shipment.health_urls')),
@@ -36,6 +36,8 @@ class ShipmentAdmin(admin.ModelAdmin):
 @admin.register(ShipmentHistory)
 class ShipmentHistoryAdmin(admin.ModelAdmin):
     list_display = ['id', 'shipment', 'status', 'location', 'timestamp']
+    # The shipment column renders Shipment.__str__; join it instead of one query per row
+    list_select_related = ['shipment']
     list_filter = ['status', 'timestamp']
     search_fields = ['shipment__tracking_no', 'location', 'description']
     readonly_fields = ['timestamp']
@@ -4,8 +4,6 @@ from django.db import connection
 from django.conf import settings
 import pika
 
-from shipment import admin
-
 
 def health_check(request):
     """Basic health check"""
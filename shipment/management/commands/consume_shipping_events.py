@@ -1,13 +1,39 @@
 """
 Management command to consume RabbitMQ events
-Usage: python manage.py consume_events
+Usage: python manage.py consume_events [--workers N]
 """
-from django.core.management.base import BaseCommand
+import multiprocessing
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from shipment.rabbitmq_consumer import RabbitMQConsumer, message_callback
 import logging
 
 logger = logging.getLogger(__name__)
 
+ROUTING_KEYS = ['order.confirmed', 'order.cancelled']
+
+
+def run_worker(queue_name, prefetch_count):
+    """Consume from the queue in a worker process with its own connection"""
+    consumer = RabbitMQConsumer(prefetch_count=prefetch_count)
+
+    if not consumer.connect():
+        logger.error('Worker failed to connect to RabbitMQ')
+        sys.exit(1)
+
+    if not consumer.setup_queue(queue_name, ROUTING_KEYS):
+        logger.error('Worker failed to setup queue')
+        sys.exit(1)
+
+    consumer.start_consuming(queue_name, message_callback)
+
+    # Non-zero exit lets the parent command report a lost connection
+    if consumer.failed:
+        sys.exit(1)
+
 
 class Command(BaseCommand):
     help = 'Consume events from RabbitMQ'
@@ -19,9 +45,20 @@ class Command(BaseCommand):
             default='shipping_queue',
             help='Queue name to consume from'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of consumer processes competing on the queue'
+        )
 
     def handle(self, *args, **options):
         queue_name = options['queue']
+        workers = max(1, options['workers'])
+
+        if workers > 1:
+            self._run_workers(queue_name, workers)
+            return
 
         self.stdout.write(self.style.SUCCESS(f'Starting RabbitMQ consumer for queue: {queue_name}'))
 
@@ -29,16 +66,13 @@ class Command(BaseCommand):
 
         # Connect to RabbitMQ
         if not consumer.connect():
-            self.stdout.write(self.style.ERROR('Failed to connect to RabbitMQ'))
-            return
+            raise CommandError('Failed to connect to RabbitMQ')
 
         # Setup queue and bind routing keys
-        routing_keys = ['order.confirmed', 'order.cancelled']
-        if not consumer.setup_queue(queue_name, routing_keys):
-            self.stdout.write(self.style.ERROR('Failed to setup queue'))
-            return
+        if not consumer.setup_queue(queue_name, ROUTING_KEYS):
+            raise CommandError('Failed to setup queue')
 
-        self.stdout.write(self.style.SUCCESS(f'Listening for events: {", ".join(routing_keys)}'))
+        self.stdout.write(self.style.SUCCESS(f'Listening for events: {", ".join(ROUTING_KEYS)}'))
 
         try:
             # Start consuming
@@ -47,3 +81,40 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('\nStopping consumer...'))
             consumer.stop_consuming()
             self.stdout.write(self.style.SUCCESS('Consumer stopped'))
+
+        if consumer.failed:
+            raise CommandError('Lost connection to RabbitMQ')
+
+    def _run_workers(self, queue_name, workers):
+        """Fork worker processes that share the queue and split the prefetch window"""
+        prefetch_count = max(1, settings.RABBITMQ_PREFETCH_COUNT // workers)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Starting {workers} RabbitMQ consumers for queue: {queue_name} '
+            f'(prefetch {prefetch_count} each)'
+        ))
+
+        # Children must open their own database connections
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_worker, args=(queue_name, prefetch_count), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Workers receive the same SIGINT and stop their own consumers
+            self.stdout.write(self.style.WARNING('\nStopping consumers...'))
+            for process in processes:
+                process.join()
+            self.stdout.write(self.style.SUCCESS('Consumers stopped'))
+
+        failed = sum(1 for process in processes if process.exitcode)
+        if failed:
+            raise CommandError(f'{failed} of {workers} consumers exited with an error')
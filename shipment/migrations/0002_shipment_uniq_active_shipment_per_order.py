@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-15 10:12
+
+from django.db import migrations, models
+from django.db.models import Count
+
+ACTIVE_STATUSES = ["PENDING", "PICKED_UP", "IN_TRANSIT"]
+
+
+def check_duplicate_active_shipments(apps, schema_editor):
+    """
+    Refuse to add the constraint while orders have several active shipments
+
+    Which duplicate to keep is a business decision, so the offending orders
+    are reported for manual cleanup instead of being resolved here.
+    """
+    Shipment = apps.get_model("shipment", "Shipment")
+    duplicates = list(
+        Shipment.objects.using(schema_editor.connection.alias)
+        .filter(status__in=ACTIVE_STATUSES)
+        .values("order_id")
+        .annotate(active=Count("id"))
+        .filter(active__gt=1)
+        .values_list("order_id", flat=True)[:50]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add uniq_active_shipment_per_order: orders with more than "
+            f"one active shipment (first 50): {duplicates}. Move all but one "
+            "shipment per order to a terminal status, then re-run migrate."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shipment", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            check_duplicate_active_shipments, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="shipment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ACTIVE_STATUSES)),
+                fields=("order_id",),
+                name="uniq_active_shipment_per_order",
+            ),
+        ),
+    ]
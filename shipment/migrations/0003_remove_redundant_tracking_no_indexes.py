@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-15 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shipment", "0002_shipment_uniq_active_shipment_per_order"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="shipment",
+            name="shipments_trackin_0edf92_idx",
+        ),
+        migrations.AlterField(
+            model_name="shipment",
+            name="tracking_no",
+            field=models.CharField(max_length=50, unique=True),
+        ),
+    ]
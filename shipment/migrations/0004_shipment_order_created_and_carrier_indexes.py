@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-15 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shipment", "0003_remove_redundant_tracking_no_indexes"),
+    ]
+
+    operations = [
+        # A plain AlterField would drop every single-column btree index on
+        # order_id, including the one backing uniq_active_shipment_per_order;
+        # drop only the db_index one by name
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'DROP INDEX IF EXISTS "shipments_order_id_cd5ec97c"',
+                    reverse_sql='CREATE INDEX "shipments_order_id_cd5ec97c" ON "shipments" ("order_id")',
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name="shipment",
+                    name="order_id",
+                    field=models.IntegerField(help_text="Reference to order in Order Service"),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="shipment",
+            index=models.Index(
+                fields=["order_id", "-created_at"], name="shipments_order_i_58e747_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="shipment",
+            index=models.Index(fields=["carrier"], name="shipments_carrier_428e44_idx"),
+        ),
+    ]
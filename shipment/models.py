@@ -1,6 +1,14 @@
+import secrets
+
 from django.db import models
 from django.utils import timezone
 
+# Statuses during which an order may have only one shipment
+ACTIVE_STATUSES = ['PENDING', 'PICKED_UP', 'IN_TRANSIT']
+
+# Name of the constraint enforcing ACTIVE_STATUSES, matched in IntegrityErrors
+ACTIVE_SHIPMENT_CONSTRAINT = 'uniq_active_shipment_per_order'
+
 
 class Shipment(models.Model):
     """
@@ -24,8 +32,8 @@ class Shipment(models.Model):
     ]
 
     # Primary fields
-    order_id = models.IntegerField(db_index=True, help_text="Reference to order in Order Service")
-    tracking_no = models.CharField(max_length=50, unique=True, db_index=True)
+    order_id = models.IntegerField(help_text="Reference to order in Order Service")
+    tracking_no = models.CharField(max_length=50, unique=True)
     carrier = models.CharField(max_length=50, choices=CARRIER_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', db_index=True)
 
@@ -49,21 +57,47 @@ class Shipment(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['order_id', 'status']),
-            models.Index(fields=['tracking_no']),
             models.Index(fields=['created_at']),
+            # by_order filters on order_id and returns newest first
+            models.Index(fields=['order_id', '-created_at']),
+            # statistics counts per carrier
+            models.Index(fields=['carrier']),
+        ]
+        constraints = [
+            # At most one active shipment per order; lets the consumer insert
+            # without a pre-check and rely on the database to reject duplicates.
+            models.UniqueConstraint(
+                fields=['order_id'],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name=ACTIVE_SHIPMENT_CONSTRAINT,
+            ),
         ]
 
     def __str__(self):
         return f"Shipment #{self.id} - Order {self.order_id} - {self.tracking_no}"
 
+    @staticmethod
+    def generate_tracking_no():
+        """Random 48-bit tracking number; the unique constraint guards the rare collision"""
+        return f"TRK{secrets.token_hex(6).upper()}"
+
     def save(self, *args, **kwargs):
+        changed = []
+
         # Auto-set shipped_at when status changes to shipped states
         if self.status in ['PICKED_UP', 'IN_TRANSIT'] and not self.shipped_at:
             self.shipped_at = timezone.now()
+            changed.append('shipped_at')
 
         # Auto-set delivered_at when status is delivered
         if self.status == 'DELIVERED' and not self.delivered_at:
             self.delivered_at = timezone.now()
+            changed.append('delivered_at')
+
+        # Partial saves must still write the timestamps maintained here
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'updated_at', *changed}
 
         super().save(*args, **kwargs)
 
@@ -1,23 +1,79 @@
 import pika
-import json
+import msgspec
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import ACTIVE_SHIPMENT_CONSTRAINT, ACTIVE_STATUSES, Shipment
+from .rabbitmq_publisher import publish_event_async
+from .signals import STATISTICS_CACHE_KEY, tracking_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Seconds a partial ack batch may wait before being flushed
+ACK_FLUSH_INTERVAL = 0.2
+
+# Seconds between checks that the persistent DB connection is still usable
+DB_CHECK_INTERVAL = 60
+
+
+class OrderConfirmed(msgspec.Struct):
+    """order.confirmed payload; other fields in the message are ignored"""
+    order_id: int
+    shipping_address: str | None = ''
+
+
+class OrderCancelled(msgspec.Struct):
+    """order.cancelled payload; other fields in the message are ignored"""
+    order_id: int
+
+
+# Decoders parse and validate in one pass; strict=False keeps accepting
+# numeric strings for order_id as the old json.loads path did
+order_confirmed_decoder = msgspec.json.Decoder(OrderConfirmed, strict=False)
+order_cancelled_decoder = msgspec.json.Decoder(OrderCancelled, strict=False)
+
 
 class RabbitMQConsumer:
     """
     RabbitMQ Consumer for order events
+
+    Runs on a pika SelectConnection so heartbeats and acks are serviced by
+    the IO loop while handlers do their database work on a single worker
+    thread. One thread keeps deliveries completing in order (required for
+    multiple=True acks) and keeps Django's per-thread DB connection stable.
     """
 
-    def __init__(self):
+    def __init__(self, prefetch_count=None):
         self.connection = None
         self.channel = None
         self.exchange = settings.RABBITMQ_EXCHANGE
+        self.callback = None
+        self.prefetch_count = prefetch_count or settings.RABBITMQ_PREFETCH_COUNT
+        self.queue_name = None
+        self.routing_keys = []
+
+        self._executor = None
+        self._consumer_tag = None
+        self._pending_bindings = []
+        self._closing = False
+
+        # Set when the broker connection fails or drops without stop_consuming
+        self.failed = False
+
+        # Acks are sent with multiple=True once a batch fills or the timer fires
+        self.ack_batch_size = max(1, self.prefetch_count // 2)
+        self._pending_ack_tag = None
+        self._pending_ack_count = 0
+        self._ack_timer = None
 
     def connect(self):
-        """Establish connection to RabbitMQ"""
+        """Open the connection, running the IO loop until it succeeds or fails"""
         try:
             credentials = pika.PlainCredentials(
                 settings.RABBITMQ_USER,
@@ -31,18 +87,14 @@ class RabbitMQConsumer:
                 heartbeat=600,
                 blocked_connection_timeout=300
             )
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-
-            # Declare exchange
-            self.channel.exchange_declare(
-                exchange=self.exchange,
-                exchange_type='topic',
-                durable=True
+            self.connection = pika.SelectConnection(
+                parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed
             )
-
-            logger.info(f"Consumer connected to RabbitMQ at {settings.RABBITMQ_HOST}")
-            return True
+            self.connection.ioloop.start()
+            return not self.failed and self.connection.is_open
         except Exception as e:
             logger.error(f"Failed to connect to RabbitMQ: {str(e)}")
             return False
@@ -51,68 +103,234 @@ class RabbitMQConsumer:
         """
         Setup queue and bind to routing keys
 
+        Runs the IO loop until the exchange, queue and bindings are declared,
+        or the channel or connection fails.
+
         Args:
             queue_name: Name of the queue
             routing_keys: List of routing keys to bind (e.g., ['order.confirmed', 'order.cancelled'])
         """
+        self.queue_name = queue_name
+        self.routing_keys = list(routing_keys)
         try:
-            # Declare queue
-            self.channel.queue_declare(queue=queue_name, durable=True)
-
-            # Bind queue to routing keys
-            for routing_key in routing_keys:
-                self.channel.queue_bind(
-                    exchange=self.exchange,
-                    queue=queue_name,
-                    routing_key=routing_key
-                )
-                logger.info(f"Queue {queue_name} bound to {routing_key}")
-
-            return True
+            self.connection.channel(on_open_callback=self._on_channel_open)
+            self.connection.ioloop.start()
+            return not self.failed and self.channel is not None and self.channel.is_open
         except Exception as e:
             logger.error(f"Failed to setup queue: {str(e)}")
             return False
 
     def start_consuming(self, queue_name, callback):
         """
-        Start consuming messages from queue
+        Start consuming messages from queue; blocks until the connection closes
 
         Args:
             queue_name: Name of the queue to consume from
-            callback: Callback function to process messages
+            callback: Callback function to process messages; returns True to
+                ack the message or False to reject it. Runs on the worker
+                thread, so it must not use the channel it is given.
         """
-        try:
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=callback,
-                auto_ack=False
-            )
+        self.queue_name = queue_name
+        self.callback = callback
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='consumer')
 
-            logger.info(f"Started consuming from queue: {queue_name}")
-            self.channel.start_consuming()
+        # Open the DB connection up front and keep it across messages
+        self._executor.submit(self._open_db_connection)
+
+        try:
+            self.channel.basic_qos(prefetch_count=self.prefetch_count, callback=self._on_qos_set)
+            self.connection.ioloop.start()
         except KeyboardInterrupt:
             logger.info("Consumer stopped by user")
             self.stop_consuming()
+            # Keep the loop running until the connection has closed cleanly
+            self.connection.ioloop.start()
         except Exception as e:
             logger.error(f"Error consuming messages: {str(e)}")
-            self.stop_consuming()
+            self.failed = True
+            self.close()
+
+    @staticmethod
+    def _open_db_connection():
+        # Runs on the worker thread, which owns the Django connection
+        try:
+            connections['default'].ensure_connection()
+        except Exception as e:
+            logger.error(f"Failed to connect to database: {str(e)}")
+
+    def _on_connection_open(self, connection):
+        logger.info(f"Consumer connected to RabbitMQ at {settings.RABBITMQ_HOST}")
+        # Hand control back to connect()
+        connection.ioloop.stop()
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error(f"Failed to connect to RabbitMQ: {str(error)}")
+        self.failed = True
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        if not self._closing:
+            logger.error(f"Consumer connection closed unexpectedly: {str(reason)}")
+            self.failed = True
+        else:
+            logger.info("Consumer connection closed")
+        self.channel = None
+        self._shutdown_executor()
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+
+        # Declare exchange
+        channel.exchange_declare(
+            exchange=self.exchange,
+            exchange_type='topic',
+            durable=True,
+            callback=self._on_exchange_declared
+        )
+
+    def _on_channel_closed(self, channel, reason):
+        if not self._closing:
+            logger.error(f"Consumer channel closed: {str(reason)}")
+            self.failed = True
+        self.close()
+
+    def _on_exchange_declared(self, _frame):
+        # Declare queue
+        self.channel.queue_declare(
+            queue=self.queue_name,
+            durable=True,
+            callback=self._on_queue_declared
+        )
+
+    def _on_queue_declared(self, _frame):
+        self._pending_bindings = list(self.routing_keys)
+        self._bind_next()
+
+    def _bind_next(self, _frame=None):
+        """Bind the queue to each routing key in turn, then start consuming"""
+        if self._pending_bindings:
+            routing_key = self._pending_bindings.pop(0)
+            self.channel.queue_bind(
+                exchange=self.exchange,
+                queue=self.queue_name,
+                routing_key=routing_key,
+                callback=self._bind_next
+            )
+            logger.info(f"Queue {self.queue_name} bound to {routing_key}")
+            return
+
+        # Hand control back to setup_queue()
+        self.connection.ioloop.stop()
+
+    def _on_qos_set(self, _frame):
+        self._consumer_tag = self.channel.basic_consume(
+            queue=self.queue_name,
+            on_message_callback=self._on_message,
+            auto_ack=False
+        )
+        self.connection.ioloop.call_later(DB_CHECK_INTERVAL, self._on_db_check)
+        logger.info(f"Started consuming from queue: {self.queue_name}")
+
+    def _on_message(self, ch, method, properties, body):
+        """Hand the delivery to the worker thread"""
+        if self._closing:
+            return
+        self._executor.submit(self._handle_message, ch, method, properties, body)
+
+    def _handle_message(self, ch, method, properties, body):
+        """Run the callback on the worker thread and report back to the IO loop"""
+        try:
+            ok = self.callback(ch, method, properties, body)
+        except Exception as e:
+            logger.error(f"Unhandled error processing message: {str(e)}")
+            ok = False
+
+        self.connection.ioloop.add_callback_threadsafe(
+            partial(self._on_message_handled, method.delivery_tag, ok)
+        )
+
+    def _on_message_handled(self, delivery_tag, ok):
+        """Queue the ack, or reject on failure"""
+        if not self.channel or not self.channel.is_open:
+            return
+
+        if not ok:
+            self.channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+            return
+
+        self._pending_ack_tag = delivery_tag
+        self._pending_ack_count += 1
+
+        if self._pending_ack_count >= self.ack_batch_size:
+            self.flush_acks()
+        elif self._ack_timer is None:
+            self._ack_timer = self.connection.ioloop.call_later(ACK_FLUSH_INTERVAL, self._on_ack_timer)
+
+    def _on_ack_timer(self):
+        """Flush a partial batch once the flush interval has elapsed"""
+        self._ack_timer = None
+        self.flush_acks()
+
+    def _on_db_check(self):
+        """Drop broken DB connections; the consume loop never ends a request"""
+        if self._closing:
+            return
+        self._executor.submit(close_old_connections)
+        self.connection.ioloop.call_later(DB_CHECK_INTERVAL, self._on_db_check)
+
+    def flush_acks(self):
+        """Acknowledge every pending delivery in a single frame"""
+        if self._ack_timer is not None:
+            self.connection.ioloop.remove_timeout(self._ack_timer)
+            self._ack_timer = None
+
+        if self._pending_ack_tag is not None:
+            self.channel.basic_ack(delivery_tag=self._pending_ack_tag, multiple=True)
+            self._pending_ack_tag = None
+            self._pending_ack_count = 0
 
     def stop_consuming(self):
         """Stop consuming messages"""
+        if self._closing:
+            return
+        self._closing = True
+
         try:
-            if self.channel:
-                self.channel.stop_consuming()
-            self.close()
+            if self.channel and self.channel.is_open and self._consumer_tag:
+                self.channel.basic_cancel(self._consumer_tag, callback=self._on_cancelled)
+            else:
+                self.close()
         except Exception as e:
             logger.error(f"Error stopping consumer: {str(e)}")
 
+    def _on_cancelled(self, _frame):
+        # Wait for the executor off the IO loop so heartbeats keep flowing
+        threading.Thread(target=self._drain_executor, name='consumer-stop', daemon=True).start()
+
+    def _drain_executor(self):
+        # The in-flight handler's ack callback is queued ahead of _finish_stop,
+        # so every completed delivery is acked before closing
+        self._shutdown_executor()
+        self.connection.ioloop.add_callback_threadsafe(self._finish_stop)
+
+    def _finish_stop(self):
+        if self.channel and self.channel.is_open:
+            self.flush_acks()
+        self.close()
+
+    def _shutdown_executor(self):
+        # Queued deliveries are dropped unacked; the broker redelivers them
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
     def close(self):
         """Close RabbitMQ connection"""
+        self._closing = True
         try:
-            if self.connection and not self.connection.is_closed:
+            if self.connection and not (self.connection.is_closing or self.connection.is_closed):
                 self.connection.close()
-                logger.info("Consumer connection closed")
         except Exception as e:
             logger.error(f"Error closing connection: {str(e)}")
 
@@ -121,40 +339,36 @@ def handle_order_confirmed(ch, method, properties, body):
     """
     Handle order.confirmed event
     Creates a shipment for the confirmed order
+
+    Returns True if the message should be acked, False to reject it
     """
     try:
-        from .models import Shipment
-        import random
-
-        message = json.loads(body)
+        message = order_confirmed_decoder.decode(body)
         logger.info(f"Received order.confirmed event: {message}")
 
-        order_id = message.get('order_id')
+        order_id = message.order_id
 
-        # Check if shipment already exists for this order
-        if Shipment.objects.filter(order_id=order_id, status__in=['PENDING', 'PICKED_UP', 'IN_TRANSIT']).exists():
+        # Create shipment; the uniq_active_shipment_per_order constraint
+        # rejects a second active shipment for the same order
+        try:
+            with transaction.atomic():
+                shipment = Shipment.objects.create(
+                    order_id=order_id,
+                    tracking_no=Shipment.generate_tracking_no(),
+                    carrier='DHL',  # Default carrier
+                    status='PENDING',
+                    shipping_address=message.shipping_address,
+                )
+        except IntegrityError as e:
+            if ACTIVE_SHIPMENT_CONSTRAINT not in str(e):
+                raise
             logger.info(f"Shipment already exists for order {order_id}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            return
-
-        # Create shipment
-        tracking_no = f"TRK{random.randint(1000, 9999)}"
-        while Shipment.objects.filter(tracking_no=tracking_no).exists():
-            tracking_no = f"TRK{random.randint(1000, 9999)}"
-
-        shipment = Shipment.objects.create(
-            order_id=order_id,
-            tracking_no=tracking_no,
-            carrier='DHL',  # Default carrier
-            status='PENDING',
-            shipping_address=message.get('shipping_address', ''),
-        )
+            return True
 
         logger.info(f"Created shipment {shipment.id} for order {order_id}")
 
         # Publish shipment created event
-        from .rabbitmq_publisher import publish_event
-        publish_event('shipment.created', {
+        publish_event_async('shipment.created', {
             'shipment_id': shipment.id,
             'order_id': shipment.order_id,
             'tracking_no': shipment.tracking_no,
@@ -162,50 +376,67 @@ def handle_order_confirmed(ch, method, properties, body):
             'status': shipment.status,
         })
 
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return True
     except Exception as e:
         logger.error(f"Error handling order.confirmed: {str(e)}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return False
 
 
 def handle_order_cancelled(ch, method, properties, body):
     """
     Handle order.cancelled event
     Cancels shipments for the cancelled order
+
+    Returns True if the message should be acked, False to reject it
     """
     try:
-        from .models import Shipment
-
-        message = json.loads(body)
+        message = order_cancelled_decoder.decode(body)
         logger.info(f"Received order.cancelled event: {message}")
 
-        order_id = message.get('order_id')
+        order_id = message.order_id
+
+        with transaction.atomic():
+            # Lock pending/in-transit shipments for this order. Wait for rows
+            # held by other transactions rather than skipping them: PostgreSQL
+            # re-checks the status after the wait, so a shipment another
+            # worker has just cancelled drops out and is not published twice
+            affected = list(Shipment.objects.select_for_update().filter(
+                order_id=order_id,
+                status__in=ACTIVE_STATUSES
+            ).values('id', 'tracking_no'))
+
+            if not affected:
+                return True
+
+            # Cancel them in a single UPDATE (bypasses save(), so set updated_at here)
+            Shipment.objects.filter(id__in=[row['id'] for row in affected]).update(
+                status='CANCELLED',
+                updated_at=timezone.now(),
+            )
 
-        # Find pending/in-transit shipments for this order
-        shipments = Shipment.objects.filter(
-            order_id=order_id,
-            status__in=['PENDING', 'PICKED_UP', 'IN_TRANSIT']
+        # update() sends no post_save; the cache is shared, so invalidate
+        # here once the cancellation has committed
+        cache.delete_many(
+            [STATISTICS_CACHE_KEY] + [tracking_cache_key(row['tracking_no']) for row in affected]
         )
 
-        for shipment in shipments:
-            shipment.status = 'CANCELLED'
-            shipment.save()
-
-            logger.info(f"Cancelled shipment {shipment.id} for order {order_id}")
+        # uniq_active_shipment_per_order allows at most one active shipment
+        # per order, so this publishes at most one event
+        for row in affected:
+            logger.info(f"Cancelled shipment {row['id']} for order {order_id}")
 
             # Publish shipment cancelled event
-            from .rabbitmq_publisher import publish_event
-            publish_event('shipment.cancelled', {
-                'shipment_id': shipment.id,
-                'order_id': shipment.order_id,
-                'tracking_no': shipment.tracking_no,
+            publish_event_async('shipment.cancelled', {
+                'shipment_id': row['id'],
+                'order_id': order_id,
+                'tracking_no': row['tracking_no'],
                 'reason': 'order_cancelled',
             })
 
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return True
     except Exception as e:
         logger.error(f"Error handling order.cancelled: {str(e)}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return False
 
 
 # Event handler mapping
@@ -218,13 +449,14 @@ EVENT_HANDLERS = {
 def message_callback(ch, method, properties, body):
     """
     Main message callback router
-    Routes messages to appropriate handlers based on routing key
+    Routes messages to appropriate handlers based on routing key.
+    Acking is left to the consumer, which batches it.
     """
     routing_key = method.routing_key
     handler = EVENT_HANDLERS.get(routing_key)
 
     if handler:
-        handler(ch, method, properties, body)
-    else:
-        logger.warning(f"No handler for routing key: {routing_key}")
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return handler(ch, method, properties, body)
+
+    logger.warning(f"No handler for routing key: {routing_key}")
+    return True
@@ -1,6 +1,8 @@
 import pika
-import json
+import orjson
 import logging
+import queue
+import threading
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -15,6 +17,7 @@ class RabbitMQPublisher:
         self.connection = None
         self.channel = None
         self.exchange = settings.RABBITMQ_EXCHANGE
+        self.connect()
 
     def connect(self):
         """Establish connection to RabbitMQ"""
@@ -34,6 +37,11 @@ class RabbitMQPublisher:
             self.connection = pika.BlockingConnection(parameters)
             self.channel = self.connection.channel()
 
+            # Have the broker confirm each publish on this channel; each
+            # basic_publish then blocks for its confirm, so callers on a hot
+            # path go through publish_event_async instead
+            self.channel.confirm_delivery()
+
             # Declare exchange
             self.channel.exchange_declare(
                 exchange=self.exchange,
@@ -47,6 +55,32 @@ class RabbitMQPublisher:
             logger.error(f"Failed to connect to RabbitMQ: {str(e)}")
             return False
 
+    def _ensure_channel(self):
+        """Reconnect if the persistent channel has been lost"""
+        if self.connection and self.connection.is_open and self.channel and self.channel.is_open:
+            return True
+        self.close()
+        if not self.connect():
+            logger.error("Cannot publish: RabbitMQ connection failed")
+            return False
+        return True
+
+    def _basic_publish(self, routing_key, message):
+        """Publish a single message on the current channel"""
+        # Convert message to JSON bytes; orjson handles datetimes natively,
+        # anything else (e.g. Decimal) must be converted by the caller
+        message_body = orjson.dumps(message)
+
+        self.channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            body=message_body,
+            properties=pika.BasicProperties(
+                delivery_mode=2,  # Persistent message
+                content_type='application/json'
+            )
+        )
+
     def publish(self, routing_key, message):
         """
         Publish message to RabbitMQ
@@ -55,32 +89,57 @@ class RabbitMQPublisher:
             routing_key: Event routing key (e.g., 'shipment.delivered')
             message: Dictionary message to publish
         """
-        try:
-            if not self.connection or self.connection.is_closed:
-                if not self.connect():
-                    logger.error("Cannot publish: RabbitMQ connection failed")
-                    return False
+        return self.publish_many([(routing_key, message)])
 
-            # Convert message to JSON
-            message_body = json.dumps(message, default=str)
+    def publish_many(self, events):
+        """
+        Publish several messages over the same channel
 
-            # Publish message
-            self.channel.basic_publish(
-                exchange=self.exchange,
-                routing_key=routing_key,
-                body=message_body,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Persistent message
-                    content_type='application/json'
-                )
-            )
+        Args:
+            events: List of (routing_key, message) tuples
 
-            logger.info(f"Published event: {routing_key}")
-            return True
+        Returns True only if every message was confirmed by the broker. If
+        the connection drops, it reconnects once and resends the remaining
+        messages, starting with the one that failed.
+        """
+        if not self._ensure_channel():
+            return False
+
+        published = True
+        reconnected = False
+        index = 0
+        while index < len(events):
+            routing_key, message = events[index]
+            try:
+                self._basic_publish(routing_key, message)
+                logger.info(f"Published event: {routing_key}")
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+                # Subclasses of AMQPChannelError, so must be caught first
+                logger.error(f"Broker did not accept {routing_key}: {str(e)}")
+                published = False
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                # Connection or channel is gone; reconnect and retry once
+                logger.error(f"Failed to publish message: {str(e)}")
+                self.close()
+                if reconnected or not self._ensure_channel():
+                    return False
+                reconnected = True
+                continue
+            except (TypeError, ValueError) as e:
+                logger.error(f"Failed to encode {routing_key}: {str(e)}")
+                published = False
+            index += 1
+
+        return published
+
+    def process_data_events(self):
+        """Service heartbeats while the connection is otherwise idle"""
+        try:
+            if self.connection and self.connection.is_open:
+                self.connection.process_data_events()
         except Exception as e:
-            logger.error(f"Failed to publish message: {str(e)}")
+            logger.error(f"Lost RabbitMQ connection: {str(e)}")
             self.close()
-            return False
 
     def close(self):
         """Close RabbitMQ connection"""
@@ -90,6 +149,9 @@ class RabbitMQPublisher:
                 logger.info("RabbitMQ connection closed")
         except Exception as e:
             logger.error(f"Error closing connection: {str(e)}")
+        finally:
+            self.connection = None
+            self.channel = None
 
 
 # Singleton instance
@@ -120,6 +182,77 @@ def publish_event(event_type, data):
     return publisher.publish(event_type, data)
 
 
+# Events waiting for the background publisher thread
+_event_queue = queue.Queue()
+_publisher_thread = None
+_publisher_thread_lock = threading.Lock()
+
+# Seconds the background publisher waits for events before servicing heartbeats
+IDLE_POLL_INTERVAL = 30
+
+
+def _publisher_loop():
+    """Publish queued events; the connection is owned by this thread only"""
+    publisher = RabbitMQPublisher()
+    while True:
+        try:
+            events = list(_event_queue.get(timeout=IDLE_POLL_INTERVAL))
+        except queue.Empty:
+            publisher.process_data_events()
+            continue
+
+        # Send whatever else has queued up in the same pass
+        while True:
+            try:
+                events.extend(_event_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            publisher.publish_many(events)
+        except Exception as e:
+            # Keep the thread alive so later events are still sent
+            logger.error(f"Failed to publish {len(events)} queued events: {str(e)}")
+
+
+def publish_event_async(event_type, data):
+    """
+    Queue an event for the background publisher thread and return immediately
+
+    Used on the request path and by the consumer handlers so neither waits
+    on publisher confirms. Events still queued when the process exits are
+    lost.
+
+    Args:
+        event_type: Event type (e.g., 'shipment.delivered')
+        data: Event data dictionary; must not be mutated after queueing
+    """
+    return publish_events_async([(event_type, data)])
+
+
+def publish_events_async(events):
+    """
+    Queue several events to be sent together by the background publisher thread
+
+    Args:
+        events: List of (event_type, data) tuples
+    """
+    global _publisher_thread
+    if not settings.RABBITMQ_ENABLED:
+        logger.info(f"RabbitMQ disabled, skipping {len(events)} events")
+        return False
+
+    with _publisher_thread_lock:
+        if _publisher_thread is None:
+            _publisher_thread = threading.Thread(
+                target=_publisher_loop, name='rabbitmq-publisher', daemon=True
+            )
+            _publisher_thread.start()
+
+    _event_queue.put(events)
+    return True
+
+
 def close_publisher():
     """Close publisher connection"""
     global _publisher
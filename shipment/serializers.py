@@ -1,6 +1,17 @@
 from rest_framework import serializers
 from .models import Shipment, ShipmentHistory
 
+# Valid status transitions
+_VALID_TRANSITIONS: dict[str, frozenset[str]] = {
+    'PENDING': frozenset({'PICKED_UP', 'CANCELLED'}),
+    'PICKED_UP': frozenset({'IN_TRANSIT', 'CANCELLED'}),
+    'IN_TRANSIT': frozenset({'OUT_FOR_DELIVERY', 'FAILED'}),
+    'OUT_FOR_DELIVERY': frozenset({'DELIVERED', 'FAILED'}),
+    'DELIVERED': frozenset(),  # Terminal state
+    'CANCELLED': frozenset(),  # Terminal state
+    'FAILED': frozenset({'IN_TRANSIT'}),  # Can retry
+}
+
 
 class ShipmentHistorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,6 +21,7 @@ class ShipmentHistorySerializer(serializers.ModelSerializer):
 
 
 class ShipmentSerializer(serializers.ModelSerializer):
+    """Full shipment detail, including history (list paths use ShipmentListSerializer)"""
     history = ShipmentHistorySerializer(many=True, read_only=True)
 
     class Meta:
@@ -47,14 +59,7 @@ class ShipmentCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # Auto-generate tracking number
-        import random
-        tracking_no = f"TRK{random.randint(1000, 9999)}"
-
-        # Ensure unique tracking number
-        while Shipment.objects.filter(tracking_no=tracking_no).exists():
-            tracking_no = f"TRK{random.randint(1000, 9999)}"
-
-        validated_data['tracking_no'] = tracking_no
+        validated_data['tracking_no'] = Shipment.generate_tracking_no()
         validated_data['status'] = 'PENDING'
 
         return super().create(validated_data)
@@ -75,18 +80,8 @@ class ShipmentUpdateSerializer(serializers.ModelSerializer):
         if instance:
             current_status = instance.status
 
-            # Define valid transitions
-            valid_transitions = {
-                'PENDING': ['PICKED_UP', 'CANCELLED'],
-                'PICKED_UP': ['IN_TRANSIT', 'CANCELLED'],
-                'IN_TRANSIT': ['OUT_FOR_DELIVERY', 'FAILED'],
-                'OUT_FOR_DELIVERY': ['DELIVERED', 'FAILED'],
-                'DELIVERED': [],  # Terminal state
-                'CANCELLED': [],  # Terminal state
-                'FAILED': ['IN_TRANSIT'],  # Can retry
-            }
-
-            if value != current_status and value not in valid_transitions.get(current_status, []):
+            allowed = _VALID_TRANSITIONS.get(current_status, frozenset())
+            if value != current_status and value not in allowed:
                 raise serializers.ValidationError(
                     f"Invalid status transition from {current_status} to {value}"
                 )
@@ -98,9 +93,12 @@ class ShipmentUpdateSerializer(serializers.ModelSerializer):
         location = validated_data.pop('location', None)
         description = validated_data.pop('description', None)
 
-        # Update shipment
+        # Update shipment, writing only the submitted columns
         old_status = instance.status
-        shipment = super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        shipment = instance
 
         # Create history entry if status changed
         if old_status != shipment.status:
@@ -115,7 +113,7 @@ class ShipmentUpdateSerializer(serializers.ModelSerializer):
 
 
 class ShipmentListSerializer(serializers.ModelSerializer):
-    """Lightweight serializer for list views"""
+    """Lightweight serializer for list views; omits history to avoid a query per row"""
 
     class Meta:
         model = Shipment
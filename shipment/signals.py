@@ -0,0 +1,36 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Shipment, ShipmentHistory
+
+# Cache key and TTL (seconds) for the statistics endpoint
+STATISTICS_CACHE_KEY = 'shipment:stats:v1'
+STATISTICS_CACHE_TIMEOUT = 60
+
+# TTL (seconds) for cached by_tracking responses
+TRACKING_CACHE_TIMEOUT = 30
+
+
+def tracking_cache_key(tracking_no):
+    """Cache key for the by_tracking response of a shipment"""
+    return f'shipment:trk:v1:{tracking_no}'
+
+
+@receiver(post_save, sender=Shipment)
+@receiver(post_delete, sender=Shipment)
+def invalidate_shipment_cache(sender, instance, **kwargs):
+    """Drop cached aggregates and lookups whenever a shipment is written"""
+    # Deleting before commit would let a concurrent read re-cache old rows
+    transaction.on_commit(partial(
+        cache.delete_many, [STATISTICS_CACHE_KEY, tracking_cache_key(instance.tracking_no)]
+    ))
+
+
+@receiver(post_save, sender=ShipmentHistory)
+def invalidate_history_cache(sender, instance, **kwargs):
+    """Cached by_tracking responses embed history"""
+    transaction.on_commit(partial(cache.delete, tracking_cache_key(instance.shipment.tracking_no)))
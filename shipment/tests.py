@@ -1,3 +1,477 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, models
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import ACTIVE_SHIPMENT_CONSTRAINT, Shipment, ShipmentHistory
+from .rabbitmq_consumer import ACK_FLUSH_INTERVAL, RabbitMQConsumer, handle_order_cancelled, handle_order_confirmed
+from .serializers import ShipmentHistorySerializer, ShipmentListSerializer
+
+
+def create_shipment(**kwargs):
+    kwargs.setdefault('order_id', 1)
+    kwargs.setdefault('carrier', 'DHL')
+    kwargs.setdefault('tracking_no', Shipment.generate_tracking_no())
+    return Shipment.objects.create(**kwargs)
+
+
+class ConsumerAckTests(SimpleTestCase):
+    """Ack batching and rejection on the consumer's IO loop side"""
+
+    def setUp(self):
+        self.consumer = RabbitMQConsumer(prefetch_count=4)
+        self.consumer.connection = mock.Mock()
+        self.consumer.channel = mock.Mock(is_open=True)
+        self.channel = self.consumer.channel
+        self.ioloop = self.consumer.connection.ioloop
+
+    def test_first_success_starts_flush_timer(self):
+        self.consumer._on_message_handled(1, True)
+
+        self.channel.basic_ack.assert_not_called()
+        self.ioloop.call_later.assert_called_once_with(ACK_FLUSH_INTERVAL, self.consumer._on_ack_timer)
+
+    def test_full_batch_acks_once_with_multiple(self):
+        self.assertEqual(self.consumer.ack_batch_size, 2)
+
+        self.consumer._on_message_handled(1, True)
+        self.consumer._on_message_handled(2, True)
+
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+        self.ioloop.remove_timeout.assert_called_once_with(self.ioloop.call_later.return_value)
+        self.assertIsNone(self.consumer._pending_ack_tag)
+        self.assertEqual(self.consumer._pending_ack_count, 0)
+        self.assertIsNone(self.consumer._ack_timer)
+
+    def test_timer_flushes_partial_batch(self):
+        self.consumer._on_message_handled(1, True)
+        self.consumer._on_ack_timer()
+
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        self.ioloop.remove_timeout.assert_not_called()
+        self.assertIsNone(self.consumer._ack_timer)
+
+    def test_failure_nacks_without_requeue(self):
+        self.consumer._on_message_handled(1, False)
+
+        self.channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+        self.channel.basic_ack.assert_not_called()
+        self.assertIsNone(self.consumer._pending_ack_tag)
+
+    def test_failure_keeps_pending_acks(self):
+        self.consumer._on_message_handled(1, True)
+        self.consumer._on_message_handled(2, False)
+        self.consumer.flush_acks()
+
+        self.channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=False)
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+    def test_flush_without_pending_acks_sends_nothing(self):
+        self.consumer.flush_acks()
+
+        self.channel.basic_ack.assert_not_called()
+
+    def test_closed_channel_is_ignored(self):
+        self.channel.is_open = False
+        self.consumer._on_message_handled(1, True)
+        self.consumer._on_message_handled(2, False)
+
+        self.channel.basic_ack.assert_not_called()
+        self.channel.basic_nack.assert_not_called()
+
+
+@override_settings(RABBITMQ_ENABLED=False)
+class ActiveShipmentConstraintTests(TestCase):
+    """At most one PENDING/PICKED_UP/IN_TRANSIT shipment per order"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_constraint_exists_in_database(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Shipment._meta.db_table)
+
+        self.assertIn(ACTIVE_SHIPMENT_CONSTRAINT, constraints)
+
+    def test_second_active_shipment_returns_409(self):
+        create_shipment(order_id=7)
+
+        response = self.client.post('/v1/shipments/', {'order_id': 7, 'carrier': 'DHL'}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Shipment.objects.filter(order_id=7).count(), 1)
+
+    def test_shipment_allowed_once_previous_is_terminal(self):
+        create_shipment(order_id=7, status='CANCELLED')
+
+        response = self.client.post('/v1/shipments/', {'order_id': 7, 'carrier': 'DHL'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Shipment.objects.filter(order_id=7).count(), 2)
+
+    def test_retrying_failed_shipment_returns_409_when_another_is_active(self):
+        failed = create_shipment(order_id=7, status='FAILED')
+        create_shipment(order_id=7)
+
+        response = self.client.patch(f'/v1/shipments/{failed.pk}/', {'status': 'IN_TRANSIT'}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, 'FAILED')
+
+    def test_consumer_does_not_insert_second_active_shipment(self):
+        existing = create_shipment(order_id=7)
+
+        acked = handle_order_confirmed(None, None, None, b'{"order_id": 7}')
+
+        self.assertTrue(acked)
+        self.assertEqual(list(Shipment.objects.filter(order_id=7)), [existing])
+
+
+@mock.patch.object(models.Model, 'save')
+class ShipmentSaveTests(SimpleTestCase):
+    """Partial saves must also write the timestamps save() maintains"""
+
+    def test_update_fields_include_updated_at(self, model_save):
+        Shipment(status='PENDING').save(update_fields=['notes'])
+
+        self.assertEqual(model_save.call_args.kwargs['update_fields'], {'notes', 'updated_at'})
+
+    def test_update_fields_include_shipped_at(self, model_save):
+        shipment = Shipment(status='IN_TRANSIT')
+        shipment.save(update_fields=['status'])
+
+        self.assertIsNotNone(shipment.shipped_at)
+        self.assertEqual(
+            model_save.call_args.kwargs['update_fields'], {'status', 'updated_at', 'shipped_at'}
+        )
+
+    def test_update_fields_include_delivered_at(self, model_save):
+        shipment = Shipment(status='DELIVERED')
+        shipment.save(update_fields=['status'])
+
+        self.assertIsNotNone(shipment.delivered_at)
+        self.assertEqual(
+            model_save.call_args.kwargs['update_fields'], {'status', 'updated_at', 'delivered_at'}
+        )
+
+    def test_existing_timestamp_not_added(self, model_save):
+        shipment = Shipment(status='IN_TRANSIT', shipped_at=mock.sentinel.shipped_at)
+        shipment.save(update_fields=['status'])
+
+        self.assertIs(shipment.shipped_at, mock.sentinel.shipped_at)
+        self.assertEqual(model_save.call_args.kwargs['update_fields'], {'status', 'updated_at'})
+
+    def test_full_save_leaves_update_fields_unset(self, model_save):
+        Shipment(status='PICKED_UP').save()
+
+        self.assertNotIn('update_fields', model_save.call_args.kwargs)
+
+
+class ShipmentHistoryViewTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_shipment_without_history_returns_empty_list(self):
+        shipment = create_shipment()
+
+        response = self.client.get(f'/v1/shipments/{shipment.pk}/history/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_unknown_shipment_returns_404(self):
+        response = self.client.get('/v1/shipments/999999/history/')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_non_numeric_id_returns_404(self):
+        response = self.client.get('/v1/shipments/abc/history/')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_history_entries_newest_first(self):
+        shipment = create_shipment()
+        first = ShipmentHistory.objects.create(shipment=shipment, status='PENDING', location='Chennai')
+        second = ShipmentHistory.objects.create(shipment=shipment, status='PICKED_UP', description='Collected')
+
+        response = self.client.get(f'/v1/shipments/{shipment.pk}/history/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['id'] for entry in response.data], [second.id, first.id])
+        self.assertEqual(set(response.data[0]), set(ShipmentHistorySerializer.Meta.fields))
+        self.assertEqual(response.data[1]['location'], 'Chennai')
+
+    def test_history_timestamps_in_local_time(self):
+        shipment = create_shipment()
+        entry = ShipmentHistory.objects.create(shipment=shipment, status='PENDING')
+
+        response = self.client.get(f'/v1/shipments/{shipment.pk}/history/')
+
+        timestamp = response.data[0]['timestamp']
+        self.assertEqual(timestamp, entry.timestamp)
+        self.assertEqual(timestamp.utcoffset(), timezone.localtime(entry.timestamp).utcoffset())
+
+
+class ShipmentStatisticsViewTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_statistics_pivot(self):
+        create_shipment(order_id=1, carrier='DHL', status='PENDING')
+        create_shipment(order_id=2, carrier='DHL', status='DELIVERED')
+        create_shipment(order_id=3, carrier='FedEx', status='DELIVERED')
+
+        response = self.client.get('/v1/shipments/statistics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'status_distribution': [
+                {'status': 'PENDING', 'count': 1},
+                {'status': 'DELIVERED', 'count': 2},
+            ],
+            'carrier_distribution': [
+                {'carrier': 'DHL', 'count': 2},
+                {'carrier': 'FedEx', 'count': 1},
+            ],
+            'total_shipments': 3,
+        })
+
+    def test_statistics_empty(self):
+        response = self.client.get('/v1/shipments/statistics/')
+
+        self.assertEqual(response.data, {
+            'status_distribution': [],
+            'carrier_distribution': [],
+            'total_shipments': 0,
+        })
+
+
+@mock.patch('shipment.rabbitmq_consumer.publish_event_async')
+class OrderConfirmedHandlerTests(TestCase):
+
+    def test_creates_pending_shipment_and_publishes(self, publish):
+        acked = handle_order_confirmed(None, None, None, b'{"order_id": 5, "shipping_address": "12 Anna Salai"}')
+
+        self.assertTrue(acked)
+        shipment = Shipment.objects.get(order_id=5)
+        self.assertEqual(shipment.status, 'PENDING')
+        self.assertEqual(shipment.shipping_address, '12 Anna Salai')
+        publish.assert_called_once_with('shipment.created', {
+            'shipment_id': shipment.id,
+            'order_id': 5,
+            'tracking_no': shipment.tracking_no,
+            'carrier': 'DHL',
+            'status': 'PENDING',
+        })
+
+    def test_redelivery_is_acked_without_duplicate(self, publish):
+        body = b'{"order_id": 5}'
+
+        self.assertTrue(handle_order_confirmed(None, None, None, body))
+        self.assertTrue(handle_order_confirmed(None, None, None, body))
+
+        self.assertEqual(Shipment.objects.filter(order_id=5).count(), 1)
+        publish.assert_called_once()
+
+    def test_invalid_payload_is_rejected(self, publish):
+        acked = handle_order_confirmed(None, None, None, b'{"shipping_address": "12 Anna Salai"}')
+
+        self.assertFalse(acked)
+        self.assertFalse(Shipment.objects.exists())
+        publish.assert_not_called()
+
+
+@mock.patch('shipment.rabbitmq_consumer.publish_event_async')
+class OrderCancelledHandlerTests(TestCase):
+
+    def test_cancels_active_shipment_and_publishes(self, publish):
+        shipment = create_shipment(order_id=5, status='IN_TRANSIT')
+        before = shipment.updated_at
+
+        acked = handle_order_cancelled(None, None, None, b'{"order_id": 5}')
+
+        self.assertTrue(acked)
+        shipment.refresh_from_db()
+        self.assertEqual(shipment.status, 'CANCELLED')
+        self.assertGreater(shipment.updated_at, before)
+        publish.assert_called_once_with('shipment.cancelled', {
+            'shipment_id': shipment.id,
+            'order_id': 5,
+            'tracking_no': shipment.tracking_no,
+            'reason': 'order_cancelled',
+        })
+
+    def test_terminal_shipments_are_left_alone(self, publish):
+        delivered = create_shipment(order_id=5, status='DELIVERED')
+
+        self.assertTrue(handle_order_cancelled(None, None, None, b'{"order_id": 5}'))
+
+        delivered.refresh_from_db()
+        self.assertEqual(delivered.status, 'DELIVERED')
+        publish.assert_not_called()
+
+    def test_other_orders_are_left_alone(self, publish):
+        other = create_shipment(order_id=6)
+
+        self.assertTrue(handle_order_cancelled(None, None, None, b'{"order_id": 5}'))
+
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'PENDING')
+        publish.assert_not_called()
+
+    def test_invalid_payload_is_rejected(self, publish):
+        self.assertFalse(handle_order_cancelled(None, None, None, b'{"order_id": "abc"}'))
+        publish.assert_not_called()
+
+
+class StatisticsCacheTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_statistics_served_from_cache(self):
+        create_shipment()
+        self.client.get('/v1/shipments/statistics/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/v1/shipments/statistics/')
+
+        self.assertEqual(response.data['total_shipments'], 1)
+
+    def test_saving_shipment_invalidates_statistics(self):
+        self.client.get('/v1/shipments/statistics/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_shipment()
+        response = self.client.get('/v1/shipments/statistics/')
+
+        self.assertEqual(response.data['total_shipments'], 1)
+
+    def test_deleting_shipment_invalidates_statistics(self):
+        shipment = create_shipment()
+        self.client.get('/v1/shipments/statistics/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shipment.delete()
+        response = self.client.get('/v1/shipments/statistics/')
+
+        self.assertEqual(response.data['total_shipments'], 0)
+
+
+@override_settings(RABBITMQ_ENABLED=False)
+class TrackingCacheTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.shipment = create_shipment(order_id=5)
+        self.url = f'/v1/shipments/by_tracking/?tracking_no={self.shipment.tracking_no}'
+
+    def test_by_tracking_served_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data['status'], 'PENDING')
+
+    def test_status_update_invalidates_cached_lookup(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/v1/shipments/{self.shipment.pk}/', {'status': 'PICKED_UP'}, format='json')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['status'], 'PICKED_UP')
+        self.assertEqual(len(response.data['history']), 1)
+
+    def test_history_entry_invalidates_cached_lookup(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ShipmentHistory.objects.create(shipment=self.shipment, status='PENDING', location='Chennai')
+        response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data['history']), 1)
+
+    @mock.patch('shipment.rabbitmq_consumer.publish_event_async')
+    def test_consumer_cancellation_invalidates_cached_data(self, publish):
+        self.client.get(self.url)
+        self.client.get('/v1/shipments/statistics/')
+
+        handle_order_cancelled(None, None, None, b'{"order_id": 5}')
+
+        self.assertEqual(self.client.get(self.url).data['status'], 'CANCELLED')
+        statistics = self.client.get('/v1/shipments/statistics/').data
+        self.assertEqual(statistics['status_distribution'], [{'status': 'CANCELLED', 'count': 1}])
+
+
+class ShipmentByOrderViewTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_paginated_envelope(self):
+        older = create_shipment(order_id=5, status='DELIVERED')
+        newer = create_shipment(order_id=5)
+        create_shipment(order_id=6)
+
+        response = self.client.get('/v1/shipments/by_order/?order_id=5')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'count', 'next', 'previous', 'results'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([row['id'] for row in response.data['results']], [newer.id, older.id])
+        self.assertEqual(set(response.data['results'][0]), set(ShipmentListSerializer.Meta.fields))
+
+    def test_results_are_paged(self):
+        for _ in range(21):
+            create_shipment(order_id=5, status='DELIVERED')
+
+        response = self.client.get('/v1/shipments/by_order/?order_id=5')
+
+        self.assertEqual(response.data['count'], 21)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_order_id_is_required(self):
+        response = self.client.get('/v1/shipments/by_order/')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_integer_order_id_returns_400(self):
+        response = self.client.get('/v1/shipments/by_order/?order_id=5a')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ShipmentByTrackingHeadTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_head_existing_shipment_returns_200(self):
+        shipment = create_shipment()
+
+        with self.assertNumQueries(1):
+            response = self.client.head(f'/v1/shipments/by_tracking/?tracking_no={shipment.tracking_no}')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_head_unknown_shipment_returns_404(self):
+        response = self.client.head('/v1/shipments/by_tracking/?tracking_no=TRK000000000000')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_head_without_tracking_no_returns_400(self):
+        response = self.client.head('/v1/shipments/by_tracking/')
+
+        self.assertEqual(response.status_code, 400)
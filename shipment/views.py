@@ -1,12 +1,19 @@
+from functools import partial
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 
-from .models import Shipment, ShipmentHistory
+from .models import ACTIVE_SHIPMENT_CONSTRAINT, Shipment, ShipmentHistory
 from .serializers import (
     ShipmentSerializer,
     ShipmentCreateSerializer,
@@ -14,7 +21,38 @@ from .serializers import (
     ShipmentListSerializer,
     ShipmentHistorySerializer
 )
-from .rabbitmq_publisher import publish_event
+from .rabbitmq_publisher import publish_event_async, publish_events_async
+from .signals import (
+    STATISTICS_CACHE_KEY,
+    STATISTICS_CACHE_TIMEOUT,
+    TRACKING_CACHE_TIMEOUT,
+    tracking_cache_key
+)
+
+# Status-specific event published alongside shipment.status_updated
+_STATUS_EVENT_MAP = {
+    'PICKED_UP': 'shipment.picked_up',
+    'IN_TRANSIT': 'shipment.in_transit',
+    'OUT_FOR_DELIVERY': 'shipment.out_for_delivery',
+    'DELIVERED': 'shipment.delivered',
+    'CANCELLED': 'shipment.cancelled',
+    'FAILED': 'shipment.failed',
+}
+
+# Status and carrier values reported by statistics, in display order
+_STATUS_VALUES = tuple(value for value, _ in Shipment.STATUS_CHOICES)
+_CARRIER_VALUES = tuple(value for value, _ in Shipment.CARRIER_CHOICES)
+
+# Status counts, carrier counts and the total in a single scan (PostgreSQL)
+_STATISTICS_SQL = f"""
+    SELECT status, carrier, GROUPING(status), GROUPING(carrier), COUNT(*)
+    FROM {Shipment._meta.db_table}
+    GROUP BY GROUPING SETS ((status), (carrier), ())
+"""
+
+# Shared read-only serializer for single-shipment responses; its field
+# bindings are built on first use instead of on every response
+_READ_SERIALIZER = ShipmentSerializer()
 
 
 class ShipmentViewSet(viewsets.ModelViewSet):
@@ -28,7 +66,7 @@ class ShipmentViewSet(viewsets.ModelViewSet):
     partial_update: Update shipment status (PATCH /v1/shipments/{id})
     destroy: Delete shipment
     """
-    queryset = Shipment.objects.all().prefetch_related('history')
+    queryset = Shipment.objects.all()
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'carrier', 'order_id']
@@ -36,35 +74,51 @@ class ShipmentViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'shipped_at', 'delivered_at']
     ordering = ['-created_at']
 
+    # Serializer per action; anything else uses ShipmentSerializer
+    _ACTION_SERIALIZERS = {
+        'list': ShipmentListSerializer,
+        'create': ShipmentCreateSerializer,
+        'update': ShipmentUpdateSerializer,
+        'partial_update': ShipmentUpdateSerializer,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Only the detail serializer renders history; list paths must not load it
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('history')
+        elif self.action == 'list':
+            queryset = queryset.only(*ShipmentListSerializer.Meta.fields)
+        return queryset
+
     def get_serializer_class(self):
-        if self.action == 'list':
-            return ShipmentListSerializer
-        elif self.action == 'create':
-            return ShipmentCreateSerializer
-        elif self.action in ['update', 'partial_update']:
-            return ShipmentUpdateSerializer
-        return ShipmentSerializer
+        return self._ACTION_SERIALIZERS.get(self.action, ShipmentSerializer)
 
     def create(self, request, *args, **kwargs):
         """Create a new shipment"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        shipment = serializer.save()
+        try:
+            with transaction.atomic():
+                shipment = serializer.save()
 
-        # Publish shipment created event
-        publish_event('shipment.created', {
-            'shipment_id': shipment.id,
-            'order_id': shipment.order_id,
-            'tracking_no': shipment.tracking_no,
-            'carrier': shipment.carrier,
-            'status': shipment.status,
-            'created_at': shipment.created_at.isoformat()
-        })
+                # Publish shipment created event once the row is committed
+                transaction.on_commit(partial(publish_event_async, 'shipment.created', {
+                    'shipment_id': shipment.id,
+                    'order_id': shipment.order_id,
+                    'tracking_no': shipment.tracking_no,
+                    'carrier': shipment.carrier,
+                    'status': shipment.status,
+                    'created_at': shipment.created_at
+                }))
+        except IntegrityError as e:
+            return self._active_shipment_conflict(e)
 
-        # Return full shipment details
-        output_serializer = ShipmentSerializer(shipment)
+        # Return full shipment details; a new shipment has no history, so
+        # prefetch an empty set instead of querying for it
+        prefetch_related_objects([shipment], Prefetch('history', queryset=ShipmentHistory.objects.none()))
         return Response(
-            output_serializer.data,
+            _READ_SERIALIZER.to_representation(shipment),
             status=status.HTTP_201_CREATED
         )
 
@@ -76,14 +130,26 @@ class ShipmentViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        shipment = serializer.save()
+        try:
+            with transaction.atomic():
+                shipment = serializer.save()
+
+                # Publish status change events
+                if old_status != shipment.status:
+                    self._publish_status_event(shipment, old_status)
+        except IntegrityError as e:
+            return self._active_shipment_conflict(e)
 
-        # Publish status change events
-        if old_status != shipment.status:
-            self._publish_status_event(shipment, old_status)
+        return Response(_READ_SERIALIZER.to_representation(shipment))
 
-        output_serializer = ShipmentSerializer(shipment)
-        return Response(output_serializer.data)
+    def _active_shipment_conflict(self, error):
+        """Answer a second active shipment for an order with 409; re-raise anything else"""
+        if ACTIVE_SHIPMENT_CONSTRAINT not in str(error):
+            raise error
+        return Response(
+            {'error': 'An active shipment already exists for this order'},
+            status=status.HTTP_409_CONFLICT
+        )
 
     def partial_update(self, request, *args, **kwargs):
         """Update shipment status (partial update)"""
@@ -91,7 +157,9 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         return self.update(request, *args, **kwargs)
 
     def _publish_status_event(self, shipment, old_status):
-        """Publish RabbitMQ events based on status changes"""
+        """Publish RabbitMQ events based on status changes once the update commits"""
+        # Built once and shared by both events (neither is mutated after queueing);
+        # datetimes are serialized by the publisher's orjson encoder
         event_data = {
             'shipment_id': shipment.id,
             'order_id': shipment.order_id,
@@ -99,39 +167,47 @@ class ShipmentViewSet(viewsets.ModelViewSet):
             'carrier': shipment.carrier,
             'old_status': old_status,
             'new_status': shipment.status,
-            'updated_at': shipment.updated_at.isoformat()
+            'updated_at': shipment.updated_at
         }
+        if shipment.status == 'DELIVERED':
+            event_data['delivered_at'] = shipment.delivered_at
 
-        # Publish specific events based on status
-        if shipment.status == 'PICKED_UP':
-            publish_event('shipment.picked_up', event_data)
-        elif shipment.status == 'IN_TRANSIT':
-            publish_event('shipment.in_transit', event_data)
-        elif shipment.status == 'OUT_FOR_DELIVERY':
-            publish_event('shipment.out_for_delivery', event_data)
-        elif shipment.status == 'DELIVERED':
-            event_data['delivered_at'] = shipment.delivered_at.isoformat() if shipment.delivered_at else None
-            publish_event('shipment.delivered', event_data)
-        elif shipment.status == 'CANCELLED':
-            publish_event('shipment.cancelled', event_data)
-        elif shipment.status == 'FAILED':
-            publish_event('shipment.failed', event_data)
+        # Publish the specific event for the new status plus the generic
+        # status update, queued together so they go out in one pass
+        events = []
+        event_name = _STATUS_EVENT_MAP.get(shipment.status)
+        if event_name:
+            events.append((event_name, event_data))
 
         # Always publish generic status update
-        publish_event('shipment.status_updated', event_data)
+        events.append(('shipment.status_updated', event_data))
+        transaction.on_commit(partial(publish_events_async, events))
 
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
         """Get shipment history"""
-        shipment = self.get_object()
-        history = shipment.history.all()
-        serializer = ShipmentHistorySerializer(history, many=True)
-        return Response(serializer.data)
+        # Query history directly; only look up the shipment itself when there
+        # is no history, to tell an empty history from an unknown shipment
+        try:
+            history = ShipmentHistory.objects.filter(shipment_id=pk)
+        except (TypeError, ValueError):
+            raise Http404
 
-    @action(detail=False, methods=['get'])
+        # Plain dicts instead of a many=True serializer; timestamps are moved
+        # to local time as ShipmentHistorySerializer would render them
+        data = list(history.values(*ShipmentHistorySerializer.Meta.fields))
+        for entry in data:
+            entry['timestamp'] = timezone.localtime(entry['timestamp'])
+
+        if not data and not Shipment.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response(data)
+
+    @action(detail=False, methods=['get', 'head'])
     def by_tracking(self, request):
         """Get shipment by tracking number
         GET /v1/shipments/by_tracking/?tracking_no=TRK1234
+        HEAD only checks that the shipment exists (200 or 404)
         """
         tracking_no = request.query_params.get('tracking_no')
         if not tracking_no:
@@ -140,9 +216,18 @@ class ShipmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        shipment = get_object_or_404(Shipment, tracking_no=tracking_no)
-        serializer = ShipmentSerializer(shipment)
-        return Response(serializer.data)
+        if request.method == 'HEAD':
+            exists = Shipment.objects.filter(tracking_no=tracking_no).exists()
+            return Response(status=status.HTTP_200_OK if exists else status.HTTP_404_NOT_FOUND)
+
+        key = tracking_cache_key(tracking_no)
+        data = cache.get(key)
+        if data is None:
+            shipment = get_object_or_404(Shipment, tracking_no=tracking_no)
+            data = _READ_SERIALIZER.to_representation(shipment)
+            cache.set(key, data, TRACKING_CACHE_TIMEOUT)
+
+        return Response(data)
 
     @action(detail=False, methods=['get'])
     def by_order(self, request):
@@ -156,28 +241,48 @@ class ShipmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            order_id = int(order_id)
-        except ValueError:
+        if not order_id.isdecimal():
             return Response(
                 {'error': 'order_id must be an integer'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        order_id = int(order_id)
 
-        shipments = Shipment.objects.filter(order_id=order_id)
-        serializer = ShipmentListSerializer(shipments, many=True)
-        return Response(serializer.data)
+        shipments = Shipment.objects.filter(order_id=order_id).only(*ShipmentListSerializer.Meta.fields)
+        page = self.paginate_queryset(shipments)
+        serializer = ShipmentListSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """Get shipment statistics"""
-        from django.db.models import Count
+        data = cache.get(STATISTICS_CACHE_KEY)
+        if data is None:
+            with connection.cursor() as cursor:
+                cursor.execute(_STATISTICS_SQL)
+                rows = cursor.fetchall()
+
+            # GROUPING() is 1 for a column rolled up in that row's grouping set
+            status_counts, carrier_counts, total = {}, {}, 0
+            for status_value, carrier_value, status_rolled_up, carrier_rolled_up, count in rows:
+                if not status_rolled_up:
+                    status_counts[status_value] = count
+                elif not carrier_rolled_up:
+                    carrier_counts[carrier_value] = count
+                else:
+                    total = count
 
-        stats = Shipment.objects.values('status').annotate(count=Count('id'))
-        carrier_stats = Shipment.objects.values('carrier').annotate(count=Count('id'))
+            data = {
+                'status_distribution': [
+                    {'status': value, 'count': status_counts[value]}
+                    for value in _STATUS_VALUES if value in status_counts
+                ],
+                'carrier_distribution': [
+                    {'carrier': value, 'count': carrier_counts[value]}
+                    for value in _CARRIER_VALUES if value in carrier_counts
+                ],
+                'total_shipments': total
+            }
+            cache.set(STATISTICS_CACHE_KEY, data, STATISTICS_CACHE_TIMEOUT)
 
-        return Response({
-            'status_distribution': list(stats),
-            'carrier_distribution': list(carrier_stats),
-            'total_shipments': Shipment.objects.count()
-        })
+        return Response(data)